@@ -0,0 +1,121 @@
+import glob
+import os
+from typing import Iterable, Optional, Set
+
+from prometheus_client import REGISTRY, CollectorRegistry
+from prometheus_client.metrics_core import Metric
+from prometheus_client.multiprocess import MultiProcessCollector
+
+# Suffixes of all samples a single metric family may expose.
+SAMPLE_SUFFIXES = (
+    "",
+    "_total",
+    "_created",
+    "_count",
+    "_sum",
+    "_bucket",
+    "_gcount",
+    "_gsum",
+    "_info",
+)
+
+
+def expand_names(names: Iterable[str]) -> Set[str]:
+    """Expands family names to the sample names they consist of.
+
+    `restricted_registry()` of the Prometheus client filters by sample name.
+    With this `http_request_duration_seconds` also selects its `_bucket`,
+    `_count` and `_sum` samples. Names that already end with one of the
+    suffixes are taken as sample names and kept as they are.
+    """
+
+    expanded = set()
+    for name in names:
+        if name.endswith(SAMPLE_SUFFIXES[1:]):
+            expanded.add(name)
+        else:
+            expanded.update(name + suffix for suffix in SAMPLE_SUFFIXES)
+
+    return expanded
+
+
+def restricted_registry(registry: CollectorRegistry, names: Iterable[str]):
+    """Returns object that only collects the given metric families.
+
+    Only collectors that own one of the names are called.
+    """
+
+    return registry.restricted_registry(expand_names(names))
+
+
+class RestrictedMultiProcessCollector:
+    """Collector for multiprocess mode that only collects the given families.
+
+    Multiprocess files are named after the type of the metrics they hold. The
+    types of the requested families are looked up in the registry of the
+    current process, and only files of these types are read. If a name is
+    unknown to the registry, all files are read.
+    """
+
+    def __init__(
+        self, path: str, names: Iterable[str], registry: CollectorRegistry = REGISTRY
+    ):
+        """
+        :param path: Directory with the multiprocess files.
+        :param names: Metric families or samples to collect.
+        :param registry: Registry used to look up types. Defaults to `REGISTRY`.
+        """
+
+        self._path = path
+        self._names = expand_names(names)
+        self._types = self._lookup_types(set(names), registry)
+
+    def collect(self):
+        if self._types is None:
+            files = glob.glob(os.path.join(self._path, "*.db"))
+        else:
+            files = [
+                f
+                for typ in sorted(self._types)
+                for f in glob.glob(os.path.join(self._path, f"{typ}_*.db"))
+            ]
+
+        metrics = []
+        for metric in MultiProcessCollector.merge(files, accumulate=True):
+            samples = [s for s in metric.samples if s.name in self._names]
+            if samples:
+                m = Metric(metric.name, metric.documentation, metric.type)
+                m.samples = samples
+                metrics.append(m)
+
+        return metrics
+
+    @staticmethod
+    def _lookup_types(names: Set[str], registry: CollectorRegistry) -> Optional[set]:
+        """Returns types of the given families or None if one is unknown.
+
+        The registry indexes histograms and counters only by their sample names,
+        so every name is looked up together with its suffixed sample names.
+        """
+
+        collectors = []
+        with registry._lock:
+            for name in names:
+                collectors.append(
+                    next(
+                        (
+                            registry._names_to_collectors[n]
+                            for n in sorted(expand_names([name]))
+                            if n in registry._names_to_collectors
+                        ),
+                        None,
+                    )
+                )
+
+        types = set()
+        for collector in collectors:
+            if collector is None or not hasattr(collector, "describe"):
+                return None
+            types.update(metric.type for metric in collector.describe())
+
+        return types
@@ -1,12 +1,16 @@
 import os
 import re
+from contextlib import contextmanager
 from functools import wraps
+from threading import Lock
 from timeit import default_timer
 from typing import Tuple
 
-from flask import Flask, request
+from flask import Flask, has_request_context, request
 from prometheus_client import Histogram
 
+from .windows import SlidingWindow
+
 
 class PrometheusFlaskInstrumentator:
     def __init__(
@@ -20,6 +24,9 @@ class PrometheusFlaskInstrumentator:
         metric_name: str = "http_request_duration_seconds",
         label_names: tuple = ("method", "handler", "status",),
         round_latency_decimals: int = 4,
+        should_track_windows: bool = False,
+        window_seconds: int = 60,
+        operation_metric_name: str = "http_request_operation_duration_seconds",
     ):
         """
         :param should_group_status_codes: Groups all status codes into `1xx`, `2xx` 
@@ -48,6 +55,20 @@ class PrometheusFlaskInstrumentator:
 
         :param round_latency_decimals: Number of decimals latencies should be 
             rounded to, provided `should_round_latency_decimals` is `True    
+
+        :param should_track_windows: Should request rate, error rate and 
+            latency of the last `window_seconds` be tracked per handler in 
+            process? Can be read with `snapshot()`. Untemplated requests are 
+            only tracked if `should_group_untemplated` is `True`. Defaults 
+            to False.
+
+        :param window_seconds: Length of the window in seconds. Must be at 
+            least 1. Defaults to 60.
+
+        :param operation_metric_name: Name of the metric recorded by 
+            `time_operation()`. Only registered on first use. Must differ 
+            between instrumentators that both time operations. Defaults to 
+            "http_request_operation_duration_seconds".
         """
 
         self.should_group_status_codes = should_group_status_codes
@@ -68,6 +89,17 @@ class PrometheusFlaskInstrumentator:
         self.metric_name = metric_name
         self.label_names = label_names
         self.round_latency_decimals = round_latency_decimals
+        self.should_track_windows = should_track_windows
+
+        if window_seconds < 1:
+            raise ValueError(f"window_seconds={window_seconds} must be at least 1.")
+        self.window_seconds = window_seconds
+        self.operation_metric_name = operation_metric_name
+
+        self._windows = {}
+        self._windows_lock = Lock()
+        self._operation_histogram = None
+        self._operation_histogram_lock = Lock()
 
     def instrument(self, app: Flask) -> "self":
         """Performs the actual instrumentation by using Flask hooks.
@@ -89,6 +121,9 @@ class PrometheusFlaskInstrumentator:
                 return
 
             request._custom_start_time = default_timer()
+            request._pfi_handler = self._create_handler_label(
+                request.url_rule, request.path
+            )
 
         @app.after_request
         def act_after_request(response):
@@ -100,20 +135,25 @@ class PrometheusFlaskInstrumentator:
             if self.should_round_latency_decimals:
                 total_time = round(total_time, self.round_latency_decimals)
 
-            histogram.labels(
-                *self._create_label_tuple(
-                    request.method,
-                    request.url_rule,
-                    request.path,
-                    str(response.status_code),
-                )
-            ).observe(total_time)
+            label_tuple = self._create_label_tuple(
+                request.method, request._pfi_handler, str(response.status_code)
+            )
+
+            histogram.labels(*label_tuple).observe(total_time)
+
+            self._observe_window(label_tuple[1], total_time, response.status_code >= 500)
+
+            # Flask also calls teardown with the exception if the view raised.
+            request._pfi_observed = True
 
             return response
 
         @app.teardown_request
         def act_on_teardown_request(exception=None):
-            if not exception or self._shall_be_ignored(request):
+            if not exception or getattr(request, "_pfi_observed", False):
+                return
+
+            if self._shall_be_ignored(request):
                 return
 
             total_time = max(default_timer() - request._custom_start_time, 0)
@@ -121,11 +161,13 @@ class PrometheusFlaskInstrumentator:
             if self.should_round_latency_decimals:
                 total_time = round(total_time, self.round_latency_decimals)
 
-            histogram.labels(
-                *self._create_label_tuple(
-                    request.method, request.url_rule, request.path, "500"
-                )
-            ).observe(total_time)
+            label_tuple = self._create_label_tuple(
+                request.method, request._pfi_handler, "500"
+            )
+
+            histogram.labels(*label_tuple).observe(total_time)
+
+            self._observe_window(label_tuple[1], total_time, True)
 
         return self
 
@@ -136,6 +178,12 @@ class PrometheusFlaskInstrumentator:
         just one of them, suited for both multiprocess and singleprocess mode. 
         Refer to the Prometheus Python client documentation for more information.
 
+        Scrapes can be restricted to certain metric families with one or more 
+        `name[]` query parameters, for example 
+        `/metrics?name[]=http_request_duration_seconds`. Only collectors that 
+        own the requested families are called. In multiprocess mode only files 
+        that can contain the requested families are read.
+
         :param app: Flask app where the endpoint should be added to.
         :param endpoint: Route of the endpoint. Defaults to "/metrics".
         :param return: self.
@@ -145,6 +193,10 @@ class PrometheusFlaskInstrumentator:
                                        CollectorRegistry, generate_latest,
                                        multiprocess)
 
+        from .exposition import (RestrictedMultiProcessCollector,
+                                 restricted_registry)
+
+        pmd = None
         if "prometheus_multiproc_dir" in os.environ:
             pmd = os.environ["prometheus_multiproc_dir"]
             if os.path.isdir(pmd):
@@ -159,36 +211,170 @@ class PrometheusFlaskInstrumentator:
 
         @app.route(endpoint)
         def metrics():
-            data = generate_latest(registry)
+            names = request.args.getlist("name[]")
+            if not names:
+                data = generate_latest(registry)
+            elif pmd:
+                data = generate_latest(RestrictedMultiProcessCollector(pmd, names))
+            else:
+                data = generate_latest(restricted_registry(registry, names))
+
             headers = {
                 "Content-Type": CONTENT_TYPE_LATEST,
                 "Content-Length": str(len(data)),
             }
             return data, 200, headers
 
+        return self
+
+    def expose_snapshot(self, app: Flask, endpoint: str = "/metrics/snapshot") -> "self":
+        """Exposes `snapshot()` as compact JSON by adding endpoint to the given app.
+
+        Meant for autoscalers and load balancer health checks that need current 
+        numbers without going through Prometheus. Requires 
+        `should_track_windows` to be `True`. Values are local to the process.
+
+        :param app: Flask app where the endpoint should be added to.
+        :param endpoint: Route of the endpoint. Defaults to "/metrics/snapshot".
+        :param return: self.
+        """
+
+        from flask import jsonify
+
+        @app.route(endpoint)
+        def metrics_snapshot():
+            return jsonify(self.snapshot())
+
+        return self
+
+    def snapshot(self, quantile: float = 0.95) -> dict:
+        """Returns windowed request rate, error rate and latency per handler.
+
+        Cost is linear in the number of handlers and independent of the number 
+        of series and buckets in the registry.
+
+        :param quantile: Latency quantile to estimate. Defaults to 0.95.
+        :return: Dict mapping handler to a dict with `count`, 
+            `requests_per_second`, `error_rate` and the quantile (e.g. `p95`).
+        """
+
+        with self._windows_lock:
+            windows = list(self._windows.items())
+
+        return {handler: window.snapshot(quantile) for handler, window in windows}
+
+    @contextmanager
+    def time_operation(self, operation: str):
+        """Times an operation within the current request, e.g. a DB query.
+
+        The duration is recorded in a histogram labeled with method and handler 
+        of the current request as resolved by the instrumentator before the 
+        request, plus the given operation. Does nothing outside of requests 
+        and for requests that are ignored. Usable as context manager and as 
+        decorator:
+
+        ```python
+        with instrumentator.time_operation("db"):
+            db.query()
+
+        @instrumentator.time_operation("cache")
+        def get_cached(): ...
+        ```
+
+        :param operation: Value of the `operation` label.
+        """
+
+        handler = None
+        if has_request_context():
+            handler = getattr(request, "_pfi_handler", None)
+
+        if handler is None or getattr(request, "_pfi_ignore", False):
+            yield
+            return
+
+        start_time = default_timer()
+        try:
+            yield
+        finally:
+            total_time = max(default_timer() - start_time, 0)
+
+            if self.should_round_latency_decimals:
+                total_time = round(total_time, self.round_latency_decimals)
+
+            self._get_operation_histogram().labels(
+                request.method, handler, operation
+            ).observe(total_time)
+
+    def _get_operation_histogram(self) -> Histogram:
+        """Creates histogram for `time_operation()` on first use.
+
+        Instrumentators that never time operations don't register it, so 
+        multiple instrumentators can coexist in one process.
+        """
+
+        if self._operation_histogram is None:
+            with self._operation_histogram_lock:
+                if self._operation_histogram is None:
+                    self._operation_histogram = Histogram(
+                        name=self.operation_metric_name,
+                        documentation=(
+                            "Duration of operations within HTTP requests in seconds"
+                        ),
+                        labelnames=self.label_names[:2] + ("operation",),
+                        buckets=self.buckets,
+                    )
+
+        return self._operation_histogram
+
+    def _observe_window(self, handler: str, amount: float, is_error: bool) -> None:
+        """Records request in the sliding window of the given handler."""
+
+        if not self.should_track_windows:
+            return
+
+        # Every untemplated path would allocate a window that is never evicted.
+        if not request.url_rule and not self.should_group_untemplated:
+            return
+
+        handler = str(handler)
+        window = self._windows.get(handler)
+        if window is None:
+            with self._windows_lock:
+                window = self._windows.setdefault(
+                    handler, SlidingWindow(self.buckets, self.window_seconds)
+                )
+
+        window.observe(amount, is_error)
+
     def _create_label_tuple(
-        self, method: str, url_rule: str, url_path: str, code: str
+        self, method: str, handler: str, code: str
     ) -> Tuple[str, str, str]:
-        """Processes label values based on config."""
+        """Processes label values based on config.
+
+        The handler is resolved once per request by `_create_handler_label()`.
+        """
 
         if self.should_group_status_codes:
             code = code[0] + "xx"
 
-        # 'self.should_ignore_untemplated' will always be 'False'
-
-        if url_rule:
-            handler = url_rule
-        elif self.should_group_untemplated:
-            handler = "none"
-        else:
-            handler = url_path
-
         return (
             method,
             handler,
             code,
         )
 
+    def _create_handler_label(self, url_rule: str, url_path: str) -> str:
+        """Processes handler label value based on config."""
+
+        # 'self.should_ignore_untemplated' will always be 'False'
+
+        if url_rule:
+            return url_rule
+        elif self.should_group_untemplated:
+            return "none"
+        else:
+            return url_path
+
     def _shall_be_ignored(self, request) -> bool:
         """Decides if the request should be ignored or not.
         
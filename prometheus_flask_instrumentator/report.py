@@ -0,0 +1,340 @@
+"""Cardinality and memory footprint report for instrumented Flask apps.
+
+Run `python -m prometheus_flask_instrumentator.report --help` for the CLI.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+from typing import Iterable, List, Optional, Tuple
+
+from flask import Flask
+from prometheus_client import REGISTRY, CollectorRegistry, Histogram, generate_latest
+
+from .instrumentation import PrometheusFlaskInstrumentator
+
+# Status codes assumed to be returned by every handler if nothing else is given.
+COMMON_STATUS_CODES = (
+    200,
+    201,
+    204,
+    301,
+    302,
+    304,
+    400,
+    401,
+    403,
+    404,
+    405,
+    409,
+    422,
+    429,
+    500,
+    502,
+    503,
+    504,
+)
+
+# Status codes of requests that do not match any URL rule.
+UNTEMPLATED_STATUS_CODES = (404, 405)
+
+# Status codes of methods added automatically: `HEAD` by Werkzeug for every
+# `GET` rule and `OPTIONS` by Flask. They rarely return anything else.
+AUTOMATIC_STATUS_CODES = (200,)
+
+# Latency observed once per label set to get realistic sample values.
+TYPICAL_LATENCY = 0.0123456789
+
+
+def enumerate_label_tuples(
+    app: Flask,
+    instrumentator: PrometheusFlaskInstrumentator,
+    status_codes: Iterable[int] = COMMON_STATUS_CODES,
+) -> Tuple[List[Tuple[str, str, str]], bool]:
+    """Enumerates all label tuples the instrumentator may produce for the app.
+
+    :param app: Flask app whose `url_map` is enumerated.
+    :param instrumentator: Instrumentator with the config to evaluate.
+    :param status_codes: Status codes every handler is assumed to return.
+        Methods added automatically (`HEAD` and `OPTIONS`) are assumed to
+        only return `AUTOMATIC_STATUS_CODES`.
+    :return: List of label tuples and whether the real number is unbounded.
+        The latter is the case if untemplated requests are neither ignored
+        nor grouped, as every requested path becomes a handler.
+    """
+
+    codes_per_method = {}
+    for rule in app.url_map.iter_rules():
+        if any(p.search(rule.rule) for p in instrumentator.excluded_handlers):
+            continue
+        for method in rule.methods or ():
+            codes = status_codes
+            if _is_automatic_method(rule, method):
+                codes = AUTOMATIC_STATUS_CODES
+            codes_per_method.setdefault((rule.rule, method), set()).update(codes)
+
+    unbounded = False
+    if instrumentator.should_ignore_untemplated:
+        pass
+    elif instrumentator.should_group_untemplated:
+        for method in {method for _, method in codes_per_method}:
+            codes_per_method[("none", method)] = set(UNTEMPLATED_STATUS_CODES)
+    else:
+        unbounded = True
+
+    label_tuples = []
+    for (handler, method), codes in sorted(codes_per_method.items()):
+        for status in _create_status_labels(instrumentator, codes):
+            label_tuples.append((method, handler, status))
+
+    return label_tuples, unbounded
+
+
+def estimate(
+    app: Flask,
+    instrumentator: PrometheusFlaskInstrumentator,
+    status_codes: Iterable[int] = COMMON_STATUS_CODES,
+) -> dict:
+    """Estimates series count, memory and exposition size of a config.
+
+    Creates the histogram in a throwaway registry, populates it with every
+    label tuple from `enumerate_label_tuples()` and measures it. Memory is
+    measured with `tracemalloc`. Nothing is registered in the default registry.
+
+    In multiprocess mode the Prometheus client writes every value into the
+    shared files, regardless of the registry. There the histogram is measured
+    in a subprocess without `prometheus_multiproc_dir`, so the files of the
+    running app stay untouched.
+
+    :param app: Flask app whose `url_map` is enumerated.
+    :param instrumentator: Instrumentator with the config to evaluate.
+    :param status_codes: Status codes every handler is assumed to return.
+    :return: Dict with `handlers`, `label_sets`, `series`, `memory_bytes`,
+        `exposition_bytes` and `unbounded`.
+    """
+
+    label_tuples, unbounded = enumerate_label_tuples(app, instrumentator, status_codes)
+
+    config = {
+        "metric_name": instrumentator.metric_name,
+        "label_names": list(instrumentator.label_names),
+        "buckets": list(instrumentator.buckets),
+        "label_tuples": label_tuples,
+    }
+    if "prometheus_multiproc_dir" in os.environ:
+        measurements = _measure_in_subprocess(config)
+    else:
+        measurements = _measure(config)
+
+    return {
+        "handlers": len({label_tuple[1] for label_tuple in label_tuples}),
+        "label_sets": len(label_tuples),
+        **measurements,
+        "unbounded": unbounded,
+    }
+
+
+def live(
+    registry: CollectorRegistry = REGISTRY,
+    metric_name: Optional[str] = "http_request_duration_seconds",
+) -> dict:
+    """Reports the actual numbers of a registry.
+
+    :param registry: Registry to collect. Defaults to `REGISTRY`.
+    :param metric_name: Name of the instrumentator metric. Its label sets
+        are reported separately. Defaults to "http_request_duration_seconds".
+    :return: Dict with `series`, `exposition_bytes`, `label_sets` of the
+        instrumentator metric and `families` mapping family name to series.
+    """
+
+    data = generate_latest(registry)
+    families = {}
+    label_sets = set()
+    for metric in registry.collect():
+        families[metric.name] = families.get(metric.name, 0) + len(metric.samples)
+        if metric.name == metric_name:
+            label_sets.update(
+                tuple(sorted((k, v) for k, v in s.labels.items() if k != "le"))
+                for s in metric.samples
+            )
+
+    return {
+        "series": sum(families.values()),
+        "exposition_bytes": len(data),
+        "label_sets": len(label_sets),
+        "families": families,
+    }
+
+
+def live_from_url(url: str, metric_name: str = "http_request_duration_seconds") -> dict:
+    """Same as `live()` but scrapes the exposition from the given URL."""
+
+    from urllib.request import urlopen
+
+    from prometheus_client.parser import text_string_to_metric_families
+
+    with urlopen(url) as response:
+        data = response.read()
+
+    class ParsedRegistry:
+        def collect(self):
+            return text_string_to_metric_families(data.decode("utf-8"))
+
+    report = live(ParsedRegistry(), metric_name)
+    report["exposition_bytes"] = len(data)
+    return report
+
+
+def _measure(config: dict) -> dict:
+    """Measures series, memory and exposition size of the given histogram."""
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    registry = CollectorRegistry()
+    histogram = Histogram(
+        name=config["metric_name"],
+        documentation="Duration of HTTP requests in seconds",
+        labelnames=config["label_names"],
+        buckets=config["buckets"],
+        registry=registry,
+    )
+    for label_tuple in config["label_tuples"]:
+        histogram.labels(*label_tuple).observe(TYPICAL_LATENCY)
+
+    memory_bytes = tracemalloc.get_traced_memory()[0] - before
+    if not was_tracing:
+        tracemalloc.stop()
+
+    return {
+        "series": _count_series(registry),
+        "memory_bytes": memory_bytes,
+        "exposition_bytes": len(generate_latest(registry)),
+    }
+
+
+def _measure_in_subprocess(config: dict) -> dict:
+    """Runs `_measure()` in a Python process in singleprocess mode."""
+
+    env = dict(os.environ)
+    del env["prometheus_multiproc_dir"]
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (package_root, env.get("PYTHONPATH")) if p
+    )
+
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import json, sys\n"
+            "from prometheus_flask_instrumentator.report import _measure\n"
+            "json.dump(_measure(json.load(sys.stdin)), sys.stdout)\n",
+        ],
+        input=json.dumps(config),
+        stdout=subprocess.PIPE,
+        env=env,
+        check=True,
+        universal_newlines=True,
+    )
+
+    return json.loads(result.stdout)
+
+
+def _create_status_labels(
+    instrumentator: PrometheusFlaskInstrumentator, codes: Iterable[int]
+) -> List[str]:
+    if instrumentator.should_group_status_codes:
+        return sorted({str(code)[0] + "xx" for code in codes})
+    return sorted({str(code) for code in codes})
+
+
+def _is_automatic_method(rule, method: str) -> bool:
+    if method == "HEAD":
+        return "GET" in rule.methods
+    if method == "OPTIONS":
+        return getattr(rule, "provide_automatic_options", False)
+    return False
+
+
+def _count_series(registry: CollectorRegistry) -> int:
+    return sum(len(metric.samples) for metric in registry.collect())
+
+
+def _load_app(path: str) -> Flask:
+    """Imports app from `module:attribute`. Attribute defaults to `app`."""
+
+    module_name, _, attribute = path.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, attribute or "app")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Estimates series count, memory and exposition size the "
+            "instrumentator produces for a Flask app, or reports live numbers."
+        ),
+    )
+    parser.add_argument("app", nargs="?", help="Flask app as 'module:attribute'.")
+    parser.add_argument("--url", help="Report live numbers scraped from this URL.")
+    parser.add_argument("--ungrouped-status-codes", action="store_true")
+    parser.add_argument("--ignore-untemplated", action="store_true")
+    parser.add_argument("--ungrouped-untemplated", action="store_true")
+    parser.add_argument(
+        "--excluded-handlers", nargs="*", default=["/metrics"], metavar="REGEX"
+    )
+    parser.add_argument("--buckets", type=float, nargs="+", metavar="BOUND")
+    parser.add_argument("--metric-name", default="http_request_duration_seconds")
+    parser.add_argument("--label-names", nargs=3, metavar="NAME")
+    parser.add_argument(
+        "--status-codes",
+        type=int,
+        nargs="+",
+        default=COMMON_STATUS_CODES,
+        metavar="CODE",
+        help="Status codes every handler is assumed to return.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.url:
+        report = live_from_url(args.url, args.metric_name)
+    elif args.app:
+        # Allow importing the app from the working directory like `flask run`.
+        inserted = "" not in sys.path
+        if inserted:
+            sys.path.insert(0, "")
+        try:
+            app = _load_app(args.app)
+        finally:
+            if inserted:
+                sys.path.remove("")
+
+        kwargs = {}
+        if args.buckets:
+            kwargs["buckets"] = tuple(args.buckets)
+        if args.label_names:
+            kwargs["label_names"] = tuple(args.label_names)
+        instrumentator = PrometheusFlaskInstrumentator(
+            should_group_status_codes=not args.ungrouped_status_codes,
+            should_ignore_untemplated=args.ignore_untemplated,
+            should_group_untemplated=not args.ungrouped_untemplated,
+            excluded_handlers=args.excluded_handlers,
+            metric_name=args.metric_name,
+            **kwargs,
+        )
+        report = estimate(app, instrumentator, args.status_codes)
+    else:
+        parser.error("either app or --url is required")
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
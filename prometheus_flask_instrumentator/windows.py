@@ -0,0 +1,148 @@
+from threading import Lock
+from time import monotonic
+from typing import Tuple
+
+
+class SlidingWindow:
+    """Ring buffer of one-second slots holding request counts and latencies.
+
+    Every slot stores the number of requests, the number of server errors and
+    the latency histogram (non-cumulative bucket counts) observed during one
+    second. Running totals over all slots within the window are maintained
+    alongside. Slots are subtracted from the totals once they fall out of the
+    window, so reading never iterates over slots.
+
+    Windows are local to the process. In multiprocess mode every worker only
+    knows about the requests it handled itself.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...], length: int = 60):
+        """
+        :param buckets: Upper bounds of latency buckets. Last one must be `inf`.
+        :param length: Length of the window in seconds. Defaults to 60.
+        """
+
+        if length < 1:
+            raise ValueError(f"Window length must be at least 1, got {length}.")
+
+        self.buckets = buckets
+        self.length = length
+
+        self._lock = Lock()
+        self._seconds = [-1] * length
+        self._counts = [0] * length
+        self._errors = [0] * length
+        self._bucket_counts = [[0] * len(buckets) for _ in range(length)]
+
+        self._count = 0
+        self._error_count = 0
+        self._bucket_totals = [0] * len(buckets)
+        self._expired_until = int(monotonic()) - length
+
+    def observe(self, amount: float, is_error: bool = False) -> None:
+        """Records a single request with the given latency."""
+
+        for b, bound in enumerate(self.buckets):
+            if amount <= bound:
+                break
+
+        with self._lock:
+            # Sampled under the lock so that a delayed thread never clears a
+            # slot that is newer than its own timestamp.
+            now = int(monotonic())
+            i = now % self.length
+
+            self._expire(now)
+            if self._seconds[i] != now:
+                self._clear(i)
+                self._seconds[i] = now
+
+            self._counts[i] += 1
+            self._bucket_counts[i][b] += 1
+            self._count += 1
+            self._bucket_totals[b] += 1
+            if is_error:
+                self._errors[i] += 1
+                self._error_count += 1
+
+    def snapshot(self, quantile: float = 0.95) -> dict:
+        """Returns the running totals of all slots still within the window.
+
+        Cost does not depend on the length of the window. Only slots that fell
+        out of the window since the last call are subtracted.
+
+        :param quantile: Latency quantile to estimate. Defaults to 0.95.
+        :return: Dict with `count`, `requests_per_second`, `error_rate` and
+            the estimated latency quantile (for example `p95` or `p99.9`).
+        """
+
+        with self._lock:
+            self._expire(int(monotonic()))
+            count = self._count
+            errors = self._error_count
+            bucket_counts = list(self._bucket_totals)
+
+        return {
+            "count": count,
+            "requests_per_second": count / self.length,
+            "error_rate": errors / count if count else 0.0,
+            f"p{quantile * 100:g}": self._estimate_quantile(
+                quantile, count, bucket_counts
+            ),
+        }
+
+    def _expire(self, now: int) -> None:
+        """Subtracts slots that fell out of the window since the last call.
+
+        Every second is visited at most once over the lifetime of the window.
+        After a gap longer than the window all slots are cleared at once.
+        Must be called with the lock held.
+        """
+
+        oldest = now - self.length
+        if oldest - self._expired_until >= self.length:
+            for i in range(self.length):
+                self._clear(i)
+        else:
+            for second in range(self._expired_until + 1, oldest + 1):
+                i = second % self.length
+                if self._seconds[i] == second:
+                    self._clear(i)
+        self._expired_until = max(self._expired_until, oldest)
+
+    def _clear(self, i: int) -> None:
+        """Subtracts slot from the running totals and resets it."""
+
+        self._count -= self._counts[i]
+        self._error_count -= self._errors[i]
+        for b, c in enumerate(self._bucket_counts[i]):
+            self._bucket_totals[b] -= c
+
+        self._seconds[i] = -1
+        self._counts[i] = 0
+        self._errors[i] = 0
+        self._bucket_counts[i] = [0] * len(self.buckets)
+
+    def _estimate_quantile(self, quantile: float, count: int, bucket_counts: list):
+        """Estimates quantile by linear interpolation within the matching bucket.
+
+        Mirrors `histogram_quantile()` of PromQL. If the quantile falls into the
+        `inf` bucket, the highest finite upper bound is returned.
+        """
+
+        if not count:
+            return None
+
+        rank = quantile * count
+        cumulative = 0
+        lower = 0.0
+
+        for bound, c in zip(self.buckets, bucket_counts):
+            if c and cumulative + c >= rank:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / c
+            cumulative += c
+            lower = bound
+
+        return lower
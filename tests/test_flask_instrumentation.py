@@ -1,10 +1,13 @@
+import json
 import os
+import sys
 
 import pytest
 from flask import Flask
-from prometheus_client import REGISTRY
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram
 
-from prometheus_flask_instrumentator import Instrumentator
+from prometheus_flask_instrumentator import (Instrumentator, exposition, report,
+                                             windows)
 
 # ==============================================================================
 # Setup
@@ -355,6 +358,7 @@ def test_unhandled_server_error():
     response = get_response(client, "/metrics")
     assert b'handler="/server_error"' in response.data
     assert b'status="5xx"' in response.data
+    assert_request_count(1, handler="/server_error", status="5xx")
 
 
 # ------------------------------------------------------------------------------
@@ -374,6 +378,97 @@ def test_custom_endpoint():
     assert b"http_request_duration_seconds_bucket" in response.data
 
 
+# ------------------------------------------------------------------------------
+# Test filtered scrapes.
+
+
+def test_filtered_scrape():
+    app = create_app()
+    Instrumentator().instrument(app).expose(app)
+    client = app.test_client()
+
+    client.get("/")
+
+    response = get_response(client, "/metrics?name[]=http_request_duration_seconds")
+    assert response.status_code == 200
+    assert b"http_request_duration_seconds_bucket" in response.data
+    assert b"http_request_duration_seconds_count" in response.data
+    assert b"process_cpu_seconds_total" not in response.data
+
+
+def test_filtered_scrape_multiple_names():
+    app = create_app()
+    Instrumentator().instrument(app).expose(app)
+    client = app.test_client()
+
+    client.get("/")
+
+    response = get_response(
+        client,
+        "/metrics?name[]=http_request_duration_seconds_count"
+        "&name[]=process_cpu_seconds_total",
+    )
+    assert b"http_request_duration_seconds_count" in response.data
+    assert b"http_request_duration_seconds_bucket" not in response.data
+    assert b"process_cpu_seconds_total" in response.data
+    assert b"python_gc" not in response.data
+
+
+def test_restricted_multiprocess_collector_reads_only_matching_files(
+    monkeypatch, tmp_path
+):
+    registry = CollectorRegistry()
+    Histogram("a_seconds", "A", registry=registry)
+    Counter("b", "B", registry=registry)
+    Gauge("c", "C", registry=registry)
+
+    for f in ("histogram_1.db", "counter_1.db", "gauge_all_1.db"):
+        (tmp_path / f).touch()
+
+    read_files = []
+
+    def merge(files, accumulate=True):
+        read_files.extend(os.path.basename(f) for f in files)
+        return []
+
+    monkeypatch.setattr(exposition.MultiProcessCollector, "merge", merge)
+
+    def collect(*names):
+        read_files.clear()
+        exposition.RestrictedMultiProcessCollector(
+            str(tmp_path), names, registry
+        ).collect()
+        return sorted(read_files)
+
+    assert collect("a_seconds") == ["histogram_1.db"]
+    assert collect("a_seconds_count") == ["histogram_1.db"]
+    assert collect("b") == ["counter_1.db"]
+    assert collect("b_total", "c") == ["counter_1.db", "gauge_all_1.db"]
+    assert collect("a_seconds", "unknown") == [
+        "counter_1.db",
+        "gauge_all_1.db",
+        "histogram_1.db",
+    ]
+
+
+def test_expand_names():
+    assert exposition.expand_names(["a_count"]) == {"a_count"}
+    assert exposition.expand_names(["b_total", "c_bucket"]) == {"b_total", "c_bucket"}
+    assert exposition.expand_names(["a"]) == {
+        "a" + suffix for suffix in exposition.SAMPLE_SUFFIXES
+    }
+
+
+def test_filtered_scrape_unknown_name():
+    app = create_app()
+    Instrumentator().instrument(app).expose(app)
+    client = app.test_client()
+
+    response = get_response(client, "/metrics?name[]=does_not_exist")
+    assert response.status_code == 200
+    assert response.data == b""
+
+
 # ------------------------------------------------------------------------------
 
 
@@ -449,6 +544,318 @@ def test_rounding():
     assert entropy < 10
 
 
+# ------------------------------------------------------------------------------
+# Test operation timing.
+
+
+def create_app_with_operations(instrumentator) -> "app":
+    app = create_app()
+
+    @app.route("/operations/<item>")
+    def operations(item):
+        with instrumentator.time_operation("db"):
+            pass
+        return cached(item)
+
+    @instrumentator.time_operation("cache")
+    def cached(item):
+        return item
+
+    @app.route("/operations_ignored")
+    @Instrumentator.do_not_track()
+    def operations_ignored():
+        with instrumentator.time_operation("db"):
+            return "ignored"
+
+    return app
+
+
+def test_time_operation():
+    instrumentator = Instrumentator()
+    app = create_app_with_operations(instrumentator)
+    instrumentator.instrument(app).expose(app)
+    client = app.test_client()
+
+    client.get("/operations/a")
+    client.get("/operations/b")
+    client.get("/operations_ignored")
+
+    for operation in ("db", "cache"):
+        result = REGISTRY.get_sample_value(
+            "http_request_operation_duration_seconds_count",
+            {"method": "GET", "handler": "/operations/<item>", "operation": operation},
+        )
+        assert result == 2
+
+    response = get_response(client, "/metrics")
+    assert b'handler="/operations_ignored"' not in response.data
+
+
+def test_time_operation_outside_request():
+    instrumentator = Instrumentator()
+    app = create_app()
+    instrumentator.instrument(app)
+
+    with instrumentator.time_operation("db"):
+        pass
+
+    assert (
+        REGISTRY.get_sample_value(
+            "http_request_operation_duration_seconds_count",
+            {"method": "GET", "handler": "none", "operation": "db"},
+        )
+        is None
+    )
+
+
+def test_handler_resolved_once(monkeypatch):
+    instrumentator = Instrumentator()
+    app = create_app()
+    instrumentator.instrument(app)
+    client = app.test_client()
+
+    calls = []
+    create_handler_label = instrumentator._create_handler_label
+
+    def counting(*args):
+        calls.append(args)
+        return create_handler_label(*args)
+
+    monkeypatch.setattr(instrumentator, "_create_handler_label", counting)
+
+    client.get("/")
+    client.get("/server_error")
+
+    assert len(calls) == 2
+    assert_request_count(1)
+    assert_request_count(1, handler="/server_error", status="5xx")
+
+
+def test_time_operation_multiple_instrumentators():
+    app_a = create_app()
+    app_b = Flask(__name__)
+    instrumentator_a = Instrumentator().instrument(app_a)
+    Instrumentator(metric_name="other_duration_seconds").instrument(app_b)
+
+    assert "http_request_operation_duration_seconds_bucket" not in (
+        REGISTRY._names_to_collectors
+    )
+
+    with app_a.test_request_context("/"):
+        app_a.preprocess_request()
+        with instrumentator_a.time_operation("db"):
+            pass
+
+    assert "http_request_operation_duration_seconds_bucket" in (
+        REGISTRY._names_to_collectors
+    )
+
+
+# ------------------------------------------------------------------------------
+# Test windowed snapshots.
+
+
+def test_snapshot_disabled_by_default():
+    app = create_app()
+    instrumentator = Instrumentator().instrument(app)
+    client = app.test_client()
+
+    client.get("/")
+
+    assert instrumentator.snapshot() == {}
+
+
+def test_snapshot():
+    app = create_app()
+    instrumentator = Instrumentator(should_track_windows=True, window_seconds=10)
+    instrumentator.instrument(app).expose(app)
+    client = app.test_client()
+
+    client.get("/")
+    client.get("/")
+    client.get("/server_error")
+    client.get("/metrics")
+
+    snapshot = instrumentator.snapshot()
+    assert "/metrics" not in snapshot
+
+    assert snapshot["/"]["count"] == 2
+    assert snapshot["/"]["requests_per_second"] == 0.2
+    assert snapshot["/"]["error_rate"] == 0.0
+    assert 0 < snapshot["/"]["p95"] <= 0.005
+
+    assert snapshot["/server_error"]["count"] == 1
+    assert snapshot["/server_error"]["error_rate"] == 1.0
+
+
+def test_snapshot_untemplated():
+    app = create_app()
+    instrumentator = Instrumentator(should_track_windows=True)
+    instrumentator.instrument(app)
+    client = app.test_client()
+
+    client.get("/does_not_exist")
+    assert instrumentator.snapshot()["none"]["count"] == 1
+
+    app = create_app()
+    instrumentator = Instrumentator(
+        should_track_windows=True, should_group_untemplated=False
+    )
+    instrumentator.instrument(app)
+    client = app.test_client()
+
+    client.get("/")
+    client.get("/does_not_exist")
+    client.get("/does_not_exist_either")
+    assert list(instrumentator.snapshot()) == ["/"]
+
+
+def test_sliding_window_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(windows, "monotonic", lambda: now[0])
+
+    window = windows.SlidingWindow(buckets=(0.1, 1, float("inf")), length=10)
+    window.observe(0.05)
+    window.observe(5, is_error=True)
+
+    now[0] += 5
+    window.observe(0.5)
+    assert window.snapshot()["count"] == 3
+    assert window.snapshot()["error_rate"] == 1 / 3
+
+    now[0] += 5
+    assert window.snapshot()["count"] == 1
+    assert window.snapshot()["error_rate"] == 0.0
+    assert 0.1 < window.snapshot()["p95"] <= 1
+
+    now[0] += 10  # Same slot as the last observation, but one lap later.
+    window.observe(0.05)
+    assert window.snapshot()["count"] == 1
+    assert window.snapshot()["p95"] <= 0.1
+
+    now[0] += 1000
+    assert window.snapshot() == {
+        "count": 0,
+        "requests_per_second": 0.0,
+        "error_rate": 0.0,
+        "p95": None,
+    }
+
+
+def test_invalid_window_seconds():
+    for window_seconds in (0, -5):
+        with pytest.raises(ValueError):
+            Instrumentator(should_track_windows=True, window_seconds=window_seconds)
+
+        with pytest.raises(ValueError):
+            windows.SlidingWindow(buckets=(float("inf"),), length=window_seconds)
+
+
+def test_sliding_window_quantile_key():
+    window = windows.SlidingWindow(buckets=(0.1, float("inf")))
+    window.observe(0.05)
+
+    assert "p99.9" in window.snapshot(0.999)
+    assert "p50" in window.snapshot(0.5)
+
+
+def test_snapshot_endpoint():
+    app = create_app()
+    instrumentator = Instrumentator(should_track_windows=True)
+    instrumentator.instrument(app).expose(app).expose_snapshot(app)
+    client = app.test_client()
+
+    client.get("/")
+
+    response = get_response(client, "/metrics/snapshot")
+    assert response.status_code == 200
+    assert response.get_json()["/"]["count"] == 1
+    assert "/metrics/snapshot" not in response.get_json()
+
+
+# ------------------------------------------------------------------------------
+# Test cardinality report.
+
+
+def test_report_label_tuples():
+    app = create_app()
+    label_tuples, unbounded = report.enumerate_label_tuples(
+        app, Instrumentator(excluded_handlers=["/to/exclude", "/static"])
+    )
+
+    assert unbounded is False
+    assert ("GET", "/", "2xx") in label_tuples
+    assert ("GET", "none", "4xx") in label_tuples
+    assert ("GET", "none", "2xx") not in label_tuples
+    assert not any(t[1] == "/to/exclude" for t in label_tuples)
+    assert len({t[2] for t in label_tuples}) == 4
+
+    # Automatic HEAD and OPTIONS are assumed to only return 200.
+    assert sorted(t for t in label_tuples if t[1] == "/") == [
+        ("GET", "/", "2xx"),
+        ("GET", "/", "3xx"),
+        ("GET", "/", "4xx"),
+        ("GET", "/", "5xx"),
+        ("HEAD", "/", "2xx"),
+        ("OPTIONS", "/", "2xx"),
+    ]
+
+
+def test_report_estimate():
+    app = create_app()
+
+    grouped = report.estimate(app, Instrumentator())
+    ungrouped = report.estimate(
+        app,
+        Instrumentator(should_group_status_codes=False, should_group_untemplated=False),
+    )
+
+    assert ungrouped["unbounded"] is True
+    assert ungrouped["label_sets"] > grouped["label_sets"]
+    series_per_label_set = len(Instrumentator().buckets) + 3  # _count, _sum, _created
+    assert grouped["series"] == grouped["label_sets"] * series_per_label_set
+    assert grouped["memory_bytes"] > 0
+    assert grouped["exposition_bytes"] > 0
+    assert "http_request_duration_seconds_bucket" not in REGISTRY._names_to_collectors
+
+
+def test_report_live():
+    app = create_app()
+    Instrumentator().instrument(app)
+    client = app.test_client()
+
+    client.get("/")
+    client.get("/")
+    client.post("/")
+
+    result = report.live()
+    assert result["label_sets"] == 2
+    assert result["families"]["http_request_duration_seconds"] > 0
+    assert result["series"] >= result["families"]["http_request_duration_seconds"]
+    assert result["exposition_bytes"] > 0
+
+
+def test_report_cli(capsys, monkeypatch, tmp_path):
+    (tmp_path / "report_cli_app.py").write_text(
+        "from flask import Flask\n"
+        "app = Flask(__name__)\n"
+        "app.add_url_rule('/', 'home', lambda: 'Hello World!')\n"
+    )
+    monkeypatch.setattr(sys, "path", [p for p in sys.path if p != ""])
+    monkeypatch.syspath_prepend(str(tmp_path))
+    sys_path = list(sys.path)
+
+    report.main(["report_cli_app:app", "--ungrouped-status-codes"])
+    assert sys.path == sys_path
+
+    result = json.loads(capsys.readouterr().out)
+    assert result["handlers"] == 3  # "/", "/static/<path:filename>" and "none".
+    assert result["unbounded"] is False
+
+    with pytest.raises(SystemExit):
+        report.main([])
+
+
 # ------------------------------------------------------------------------------
 
 
@@ -466,7 +873,7 @@ def is_prometheus_multiproc_set():
 # provided by pytest. Test with:
 #       mkdir -p /tmp/test_multiproc;
 #       export prometheus_multiproc_dir=/tmp/test_multiproc;
-#       pytest -k test_multiprocess_with_var_set;
+#       pytest -k test_multiprocess;
 #       rm -rf /tmp/test_multiproc;
 #       unset prometheus_multiproc_dir
 
@@ -489,6 +896,48 @@ def test_multiprocess_with_var_set():
     assert b"http_request_duration_seconds" in response.data
 
 
+@pytest.mark.skipif(
+    is_prometheus_multiproc_set() is False,
+    reason="Environment variable must be set before starting Python process.",
+)
+def test_multiprocess_filtered_scrape():
+    app = create_app()
+    Instrumentator().instrument(app).expose(app)
+    client = app.test_client()
+
+    get_response(client, "/")
+
+    response = get_response(client, "/metrics?name[]=http_request_duration_seconds")
+    assert response.status_code == 200
+    assert b"Multiprocess" in response.data
+    assert b"http_request_duration_seconds_bucket" in response.data
+
+    response = get_response(client, "/metrics?name[]=does_not_exist")
+    assert response.status_code == 200
+    assert response.data == b""
+
+
+@pytest.mark.skipif(
+    is_prometheus_multiproc_set() is False,
+    reason="Environment variable must be set before starting Python process.",
+)
+def test_multiprocess_report_estimate():
+    from prometheus_client import generate_latest, multiprocess
+
+    pmd = os.environ["prometheus_multiproc_dir"]
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+
+    files = sorted(os.listdir(pmd))
+    data = generate_latest(registry)
+
+    result = report.estimate(create_app(), Instrumentator())
+    assert result["series"] > 0
+
+    assert sorted(os.listdir(pmd)) == files
+    assert generate_latest(registry) == data
+
+
 @pytest.mark.skipif(
     is_prometheus_multiproc_set() is True, reason="Just test handling of env detection."
 )